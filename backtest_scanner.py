@@ -1,16 +1,26 @@
 
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from datetime import datetime, time, timedelta
+from typing import List, Dict, NamedTuple, Optional, Tuple
 from dataclasses import dataclass, field
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from operator import mul
+from multiprocessing import get_context
+from concurrent.futures import ThreadPoolExecutor
 import json
 
 from conditions import (
     AlertConditionSet,
     MarketData,
+    BarHistory,
     PriceAboveVWAPCondition,
     TwoStepMomentumCondition,
     VolumeSpike10sCondition,
     VolumeConfirmationCondition,
+    NS_PER_SEC,
+    to_ns,
+    from_ns,
     PRICE_SURGE_THRESHOLD,
     THRESH_1,
     THRESH_2,
@@ -19,12 +29,61 @@ from conditions import (
 
 # Import TWS integration - REQUIRED
 try:
-    from tws_data_fetcher import create_tws_data_app, TWSDataApp
+    from tws_data_fetcher import create_tws_data_app, TWSDataApp, HISTORICAL_WORKERS
 except ImportError:
     print("[ERROR] TWS integration not available. Install ibapi: pip install ibapi")
     exit(1)
 
-@dataclass
+# Trade outcome codes returned by _scan_tp_sl
+OUTCOME_OPEN, OUTCOME_WIN, OUTCOME_LOSS = 0, 1, 2
+OUTCOME_NAMES = ("OPEN", "WIN", "LOSS")
+
+
+def _scan_tp_sl(highs, lows, indices, tp_price: float, sl_price: float) -> Tuple[int, float, int]:
+    """
+    Walk candles in `indices` order until take-profit or stop-loss is hit.
+    
+    Returns:
+        (outcome_code, exit_price, exit_index); exit_index is -1 while the trade is still open
+    """
+    for i in indices:
+        if highs[i] >= tp_price:
+            return OUTCOME_WIN, tp_price, i
+        if lows[i] <= sl_price:
+            return OUTCOME_LOSS, sl_price, i
+    return OUTCOME_OPEN, 0.0, -1
+
+
+def _session_vwap(closes, volumes) -> array:
+    """Cumulative session VWAP at every bar, computed in a single pass"""
+    cum_pv = accumulate(map(mul, closes, volumes))
+    cum_vol = accumulate(volumes)
+    return array('d', (pv / vol if vol > 0 else 0.0 for pv, vol in zip(cum_pv, cum_vol)))
+
+
+def _parse_bar_date(ds: str) -> Optional[datetime]:
+    """
+    Parse a TWS bar date: 'YYYYMMDD' or 'YYYYMMDD HH:MM:SS', optionally followed
+    by a timezone such as 'US/Eastern'. Fixed-offset slicing is much cheaper than strptime.
+    
+    Returns:
+        The parsed datetime, or None if the string is not in one of those formats
+    """
+    parts = ds.split()
+    if not parts:
+        return None
+    d = parts[0]
+    if len(d) != 8 or not d.isdigit():
+        return None
+    if len(parts) == 1:
+        return datetime(int(d[0:4]), int(d[4:6]), int(d[6:8]))
+    t = parts[1]
+    if len(t) != 8 or t[2] != ':' or t[5] != ':' or not (t[0:2] + t[3:5] + t[6:8]).isdigit():
+        return None
+    return datetime(int(d[0:4]), int(d[4:6]), int(d[6:8]), int(t[0:2]), int(t[3:5]), int(t[6:8]))
+
+
+@dataclass(slots=True, frozen=True)
 class BacktestAlert:
     """Container for a triggered alert during backtest"""
     symbol: str
@@ -35,33 +94,137 @@ class BacktestAlert:
     conditions_triggered: List[str]
     
     def to_dict(self) -> Dict:
+        """Display-formatted view. Fields stay raw on the alert; formatting happens only here."""
         return {
             'symbol': self.symbol,
-            'timestamp': self.timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            'timestamp': self.timestamp.isoformat(sep=' ', timespec='milliseconds'),
             'price': f"${self.price:.2f}",
             'volume': f"{self.volume:,}",
             'vwap': f"${self.vwap:.2f}",
             'conditions': self.conditions_triggered
         }
 
+class TradeResult(NamedTuple):
+    """Mock-trade outcome for one alert, as produced by calculate_pl"""
+    alert: BacktestAlert
+    outcome: str
+    entry: float
+    exit: float
+    time: Optional[datetime]
+    net_pl: float
+    final_asset: float
+
 class BacktestSymbolData:
-    def __init__(self, symbol: str):
+    """Candles for one symbol stored column-wise (one array per field)"""
+    
+    __slots__ = ('symbol', 'ts_ns', 'open', 'high', 'low',
+                 'close', 'volume', 'vwap', '_sorted')
+    
+    def __init__(self, symbol: str, store_open: bool = False):
+        """
+        Args:
+            symbol: Ticker symbol
+            store_open: Keep the bar open prices. Nothing in the scan or P/L reads
+                them, so by default they are dropped and `open` is None.
+        """
         self.symbol = symbol
-        self.data: List[Dict] = []
+        self.ts_ns = array('q')  # bar times as int nanoseconds; from_ns() gives the datetime back
+        self.open = array('d') if store_open else None
+        self.high = array('d')
+        self.low = array('d')
+        self.close = array('d')
+        self.volume = array('d')
+        self.vwap = array('d')
+        self._sorted = True
+    
+    def __len__(self) -> int:
+        return len(self.ts_ns)
     
     def add_candle(self, timestamp, open_p, high, low, close, volume, vwap):
-        self.data.append({
-            'timestamp': timestamp, 'open': open_p, 'high': high, 'low': low, 
-            'close': close, 'volume': volume, 'vwap': vwap
-        })
+        ts_ns = to_ns(timestamp)
+        if self.ts_ns and ts_ns < self.ts_ns[-1]:
+            self._sorted = False
+        self.ts_ns.append(ts_ns)
+        if self.open is not None:
+            self.open.append(open_p)
+        self.high.append(high)
+        self.low.append(low)
+        self.close.append(close)
+        self.volume.append(volume)
+        self.vwap.append(vwap)
+    
+    def finalize(self):
+        """Sort all columns by timestamp. Only does work if candles arrived out of order."""
+        if self._sorted:
+            return
+        order = sorted(range(len(self.ts_ns)), key=self.ts_ns.__getitem__)
+        for name in ('ts_ns', 'open', 'high', 'low', 'close', 'volume', 'vwap'):
+            col = getattr(self, name)
+            if col is None:
+                continue
+            setattr(self, name, array(col.typecode, [col[i] for i in order]))
+        self._sorted = True
+
+def _backtest_one_symbol(symbol: str, sd: BacktestSymbolData, cs: AlertConditionSet,
+                         cooldown_ns: int, last_alert_ns: Optional[int],
+                         max_history_size: int) -> List[BacktestAlert]:
+    """
+    Scan one symbol's time-sorted candles and return its alerts.
+    Module-level so run_backtest can hand it to a worker process.
+    """
+    alerts = []
+    history = BarHistory(max_history_size)
+    
+    # Cumulative VWAP for every bar up front
+    vwaps = _session_vwap(sd.close, sd.volume)
+    # Bars failing the mandatory VWAP gate can never alert
+    candidates = cs.prefilter_batch(sd.close, vwaps)
+    
+    # One MarketData per symbol, refreshed in place for each candidate bar
+    md = MarketData(
+        symbol=symbol,
+        price=0.0,
+        volume=0,
+        vwap=0.0,
+        timestamp=None,
+        history=history
+    )
+    
+    # Bound methods hoisted out of the per-bar loop
+    append_history = history.append
+    check_all = cs.check_all
+    append_alert = alerts.append
+    
+    for ts_ns, price, volume, current_vwap, is_candidate in zip(sd.ts_ns, sd.close, sd.volume, vwaps, candidates):
+        append_history(ts_ns, price, volume)
+        
+        if not is_candidate:
+            continue
+        if last_alert_ns is not None and ts_ns - last_alert_ns < cooldown_ns:
+            continue
+        
+        ts = from_ns(ts_ns)
+        md.price = price
+        md.volume = volume
+        md.vwap = current_vwap
+        md.timestamp = ts
+        md.ts_ns = ts_ns
+        if check_all(md):
+            # check_all starts a fresh reasons list on every call, so the alert can own this one
+            append_alert(BacktestAlert(symbol, ts, price, int(volume), current_vwap, cs.triggered_reasons))
+            last_alert_ns = ts_ns
+    return alerts
+
 
 class BacktestAlertScanner:
-    def __init__(self, symbols: List[str], date: str):
+    def __init__(self, symbols: List[str], date: str, max_history_size: int = 1000):
         self.symbols = symbols
-        self.date = datetime.strptime(date, "%Y-%m-%d") if isinstance(date, str) else date
+        self.max_history_size = max_history_size
+        self.date = datetime.fromisoformat(date) if isinstance(date, str) else date
         self.symbol_data: Dict[str, BacktestSymbolData] = {s: BacktestSymbolData(s) for s in symbols}
         self.alerts: Dict[str, List[BacktestAlert]] = {s: [] for s in symbols}
         self.last_alert_time: Dict[str, datetime] = {s: None for s in symbols}
+        self.last_alert_ns: Dict[str, Optional[int]] = {s: None for s in symbols}
         self.alert_cooldown = timedelta(seconds=60)
         self.condition_sets: Dict[str, AlertConditionSet] = {}
         
@@ -70,9 +233,21 @@ class BacktestAlertScanner:
         self.trade_investment = 1000.0
         self.commission_per_trade = 1.0  # $1 minimum commission
         self.current_assets: Dict[str, float] = {s: self.initial_asset for s in symbols}
+        # symbol -> ((alert count, candle count), first bar after each alert); reused across TP/SL sweeps
+        self._exit_scan_starts: Dict[str, Tuple[Tuple[int, int], List[int]]] = {}
         
         self._initialize_condition_sets()
     
+    @property
+    def alert_cooldown(self) -> timedelta:
+        return self._alert_cooldown
+    
+    @alert_cooldown.setter
+    def alert_cooldown(self, value: timedelta):
+        # Keep an integer-nanosecond copy for the per-bar cooldown test
+        self._alert_cooldown = value
+        self._cooldown_ns = int(value.total_seconds() * NS_PER_SEC)
+    
     def _initialize_condition_sets(self):
         for symbol in self.symbols:
             cs = AlertConditionSet(f"{symbol}_backtest")
@@ -86,89 +261,94 @@ class BacktestAlertScanner:
         self.symbol_data[symbol].add_candle(ts, o, h, l, c, v, vwap)
 
     def load_data_from_tws(self, tws_app, bar_size="10 secs", duration="1 D"):
-        end_dt = datetime.combine(self.date.date(), datetime.strptime("16:00:00", "%H:%M:%S").time())
+        target_date = self.date.date()
+        end_dt = datetime.combine(target_date, time(16, 0))
         success = True
-        for symbol in self.symbols:
-            bars = tws_app.fetch_historical_bars(symbol, end_dt, duration, bar_size, "TRADES")
+        # Each request is a TWS round-trip with its own reqId, so issue them concurrently
+        # (bounded to stay within IBKR's historical-data pacing)
+        with ThreadPoolExecutor(max_workers=HISTORICAL_WORKERS) as ex:
+            fetched = list(ex.map(
+                lambda s: tws_app.fetch_historical_bars(s, end_dt, duration, bar_size, "TRADES"),
+                self.symbols
+            ))
+        for symbol, bars in zip(self.symbols, fetched):
             if not bars:
                 success = False; continue
+            bad = 0
             for bar in bars:
-                try:
-                    ds = bar['date']
-                    if ' ' in ds:
-                        parts = ds.split()
-                        if len(parts) >= 3 and '/' in parts[-1]: ds = ' '.join(parts[:-1])
-                    bdt = datetime.strptime(ds, "%Y%m%d %H:%M:%S") if len(ds) > 8 else datetime.strptime(ds, "%Y%m%d")
-                    if bdt.date() == self.date.date():
-                        self.add_candle(symbol, bdt, bar['open'], bar['high'], bar['low'], bar['close'], bar['volume'], bar['average'])
-                except: continue
+                bdt = _parse_bar_date(bar.date)
+                if bdt is None:
+                    bad += 1
+                elif bdt.date() == target_date:
+                    self.add_candle(symbol, bdt, bar.open, bar.high, bar.low, bar.close, bar.volume, bar.average)
+            if bad:
+                print(f"[WARN] {symbol}: skipped {bad} bars with an unrecognised date format")
         return success
 
-    def run_backtest(self):
+    def run_backtest(self, workers: int = 1):
+        """
+        Scan every symbol's candles for alerts.
+        
+        Args:
+            workers: Number of worker processes. Symbols are independent, so with
+                workers > 1 they are scanned in parallel; each job's columns are pickled
+                to its worker, which only pays off for many symbols or long histories.
+        """
         for symbol in self.symbols:
-            candles = sorted(self.symbol_data[symbol].data, key=lambda x: x['timestamp'])
-            price_history = {}
-            volume_history = {}
-            
-            # Cumulative tracking for accurate VWAP
-            cumulative_pv = 0.0
-            cumulative_volume = 0.0
-            
-            for candle in candles:
-                ts = candle['timestamp']
-                price = candle['close']
-                volume = candle['volume']
-                
-                # Update cumulative VWAP
-                cumulative_pv += price * volume
-                cumulative_volume += volume
-                current_vwap = cumulative_pv / cumulative_volume if cumulative_volume > 0 else 0.0
-                
-                price_history[ts] = price
-                volume_history[ts] = volume
-                
-                md = MarketData(
-                    symbol=symbol,
-                    price=price,
-                    volume=volume,
-                    vwap=current_vwap,
-                    timestamp=ts,
-                    bid=0.0,
-                    ask=0.0,
-                    price_history=price_history,
-                    volume_history=volume_history
-                )
-                cs = self.condition_sets[symbol]
-                if cs.check_all(md):
-                    last = self.last_alert_time[symbol]
-                    if last is None or (ts - last) >= self.alert_cooldown:
-                        alert = BacktestAlert(symbol, ts, price, volume, current_vwap, cs.triggered_reasons[:])
-                        self.alerts[symbol].append(alert)
-                        self.last_alert_time[symbol] = ts
+            self.symbol_data[symbol].finalize()
+        jobs = [
+            (symbol, self.symbol_data[symbol], self.condition_sets[symbol],
+             self._cooldown_ns, self.last_alert_ns[symbol], self.max_history_size)
+            for symbol in self.symbols
+        ]
+        if workers > 1 and len(jobs) > 1:
+            # spawn, not fork: the caller usually has live TWS reader threads, and forking
+            # a threaded process can copy locks held by them
+            with get_context("spawn").Pool(min(workers, len(jobs))) as pool:
+                results = pool.starmap(_backtest_one_symbol, jobs)
+        else:
+            results = [_backtest_one_symbol(*job) for job in jobs]
+        
+        for symbol, alerts in zip(self.symbols, results):
+            self.alerts[symbol].extend(alerts)
+            if alerts:
+                self.last_alert_time[symbol] = alerts[-1].timestamp
+                self.last_alert_ns[symbol] = to_ns(alerts[-1].timestamp)
         return self.alerts
 
+    def _alert_start_indices(self, symbol: str) -> List[int]:
+        """Index of the first candle after each alert, cached until alerts or candles change"""
+        sd = self.symbol_data[symbol]
+        alerts = self.alerts[symbol]
+        key = (len(alerts), len(sd))
+        cached = self._exit_scan_starts.get(symbol)
+        if cached is None or cached[0] != key:
+            starts = [bisect_right(sd.ts_ns, to_ns(alert.timestamp)) for alert in alerts]
+            cached = self._exit_scan_starts[symbol] = (key, starts)
+        return cached[1]
+
     def calculate_pl(self, tp_pct: float, sl_pct: float):
         """Calculate P/L for each alert based on subsequent candles and update assets"""
-        results = {s: [] for s in self.symbols}
+        results: Dict[str, List[TradeResult]] = {s: [] for s in self.symbols}
+        tp_mult = 1 + tp_pct / 100
+        sl_mult = 1 - sl_pct / 100
         for symbol in self.symbols:
-            candles = sorted(self.symbol_data[symbol].data, key=lambda x: x['timestamp'])
-            for alert in self.alerts[symbol]:
+            sd = self.symbol_data[symbol]
+            sd.finalize()
+            n = len(sd)
+            for alert, start in zip(self.alerts[symbol], self._alert_start_indices(symbol)):
                 entry_price = alert.price
-                tp_price = entry_price * (1 + tp_pct / 100)
-                sl_price = entry_price * (1 - sl_pct / 100)
-                
-                outcome = "OPEN"
-                exit_price = entry_price
-                exit_time = None
+                tp_price = entry_price * tp_mult
+                sl_price = entry_price * sl_mult
                 
-                # Look at subsequent candles
-                for candle in candles:
-                    if candle['timestamp'] <= alert.timestamp: continue
-                    
-                    if candle['high'] >= tp_price:
-                        outcome = "WIN"; exit_price = tp_price; exit_time = candle['timestamp']; break
-                    elif candle['low'] <= sl_price:
-                        outcome = "LOSS"; exit_price = sl_price; exit_time = candle['timestamp']; break
+                # Look at subsequent candles, starting right after the alert bar
+                code, exit_price, exit_idx = _scan_tp_sl(sd.high, sd.low, range(start, n), tp_price, sl_price)
+                outcome = OUTCOME_NAMES[code]
+                if code == OUTCOME_OPEN:
+                    exit_price = entry_price
+                    exit_time = None
+                else:
+                    exit_time = from_ns(sd.ts_ns[exit_idx])
                 
                 # Calculate Mock Trading Result
                 # Investment: $1000
@@ -176,22 +356,17 @@ class BacktestAlertScanner:
                 shares = self.trade_investment / entry_price
                 gross_pl = (exit_price - entry_price) * shares
                 
-                # Commission: $0.005 per share, $1 minimum per trade
-                entry_commission = max(1.0, shares * 0.005)
-                exit_commission = max(1.0, shares * 0.005)
-                total_commission = entry_commission + exit_commission
-                net_pl = gross_pl - total_commission
+                # Commission: $0.005 per share, $1 minimum per trade; same share count on entry and exit
+                commission = shares * 0.005
+                if commission < self.commission_per_trade:
+                    commission = self.commission_per_trade
+                net_pl = gross_pl - 2 * commission
                 
                 # Update current assets for this symbol
                 self.current_assets[symbol] += net_pl
                 
-                results[symbol].append({
-                    'alert': alert, 
-                    'outcome': outcome, 
-                    'entry': entry_price, 
-                    'exit': exit_price, 
-                    'time': exit_time,
-                    'net_pl': net_pl,
-                    'final_asset': self.current_assets[symbol]
-                })
+                results[symbol].append(TradeResult(
+                    alert, outcome, entry_price, exit_price, exit_time,
+                    net_pl, self.current_assets[symbol]
+                ))
         return results
@@ -9,8 +9,10 @@ CENTRALIZED CONFIGURATION:
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Dict, Any
 from datetime import datetime, timedelta
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
 
 
 # =============================================================================
@@ -27,27 +29,111 @@ THRESH_1 = 0.7  # 0.7% for first window
 THRESH_2 = 0.9  # 0.9% for second window (stronger)
 MAX_SPREAD_PCT = 0.5  # Maximum allowed spread as percentage of price
 
+# Per-check [DEBUG] logging of near-miss momentum readings (one line per bar when enabled)
+DEBUG_MOMENTUM = False
 
-@dataclass
+NS_PER_SEC = 1_000_000_000
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_ns(ts: datetime) -> int:
+    """Convert a naive datetime to integer nanoseconds since 1970-01-01 (no timezone shift)"""
+    delta = ts - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * NS_PER_SEC + delta.microseconds * 1_000
+
+
+def from_ns(ns: int) -> datetime:
+    """Inverse of to_ns: integer nanoseconds since 1970-01-01 back to a naive datetime"""
+    return _EPOCH + timedelta(microseconds=ns // 1_000)
+
+
+class BarHistory:
+    """
+    Bounded, time-ordered history of (timestamp, price, volume) samples.
+    
+    Timestamps (integer nanoseconds, see to_ns), prices and volumes are kept in
+    parallel columns that share one index, so conditions can locate a time
+    window with a single bisect and read either column over it. A running total
+    of volume is kept alongside, so the volume of any index range is one
+    subtraction (volume_sum). Once more than `maxlen` samples are held the
+    oldest ones are dropped; the physical delete is done in bulk so each append
+    stays O(1) amortized.
+    """
+    
+    def __init__(self, maxlen: int = 1000):
+        self.maxlen = maxlen
+        self.timestamps = array('q')
+        self.prices = array('d')
+        self.volumes = array('d')
+        # cum_volumes[k] = total volume of the samples before index k (one longer than volumes)
+        self.cum_volumes = array('d', [0.0])
+        self._start = 0  # index of the oldest live sample
+    
+    def __len__(self) -> int:
+        return len(self.timestamps) - self._start
+    
+    @property
+    def start(self) -> int:
+        """Column index of the oldest live sample; entries before it have been dropped"""
+        return self._start
+    
+    def append(self, timestamp: int, price: float, volume: float):
+        """Append a sample. Timestamps must be non-decreasing."""
+        self.timestamps.append(timestamp)
+        self.prices.append(price)
+        self.volumes.append(volume)
+        self.cum_volumes.append(self.cum_volumes[-1] + volume)
+        if len(self.timestamps) - self._start > self.maxlen:
+            self._start += 1
+            if self._start >= self.maxlen:
+                del self.timestamps[:self._start]
+                del self.prices[:self._start]
+                del self.volumes[:self._start]
+                del self.cum_volumes[:self._start]
+                self._start = 0
+    
+    def bisect_left(self, timestamp: int, lo: int = 0) -> int:
+        """Index of the first sample with ts >= timestamp, searching from index `lo` on"""
+        return bisect_left(self.timestamps, timestamp, max(lo, self._start))
+    
+    def bisect_right(self, timestamp: int, lo: int = 0) -> int:
+        """Index of the first sample with ts > timestamp, searching from index `lo` on"""
+        return bisect_right(self.timestamps, timestamp, max(lo, self._start))
+    
+    def volume_sum(self, lo: int, hi: int) -> float:
+        """Total volume of the samples in index range [lo, hi)"""
+        return self.cum_volumes[hi] - self.cum_volumes[lo]
+
+
+@dataclass(slots=True)
 class MarketData:
     """Container for current market data"""
     symbol: str
     price: float
-    volume: int
+    volume: float  # this bar's / tick's volume; TWS sizes can be fractional
     vwap: float
     timestamp: datetime
     bid: float = 0.0
     ask: float = 0.0
-    price_history: Dict[str, float] = None  # timestamp -> price
-    volume_history: Dict[str, int] = None  # timestamp -> volume
+    history: BarHistory = None  # the owner's live history while checking; None on alerts handed out
+    ts_ns: int = 0  # timestamp as integer nanoseconds, the clock used by history
 
 
 class AlertCondition(ABC):
     """Base class for all alert conditions. Extend this to add new conditions."""
     
+    __slots__ = ('name', 'triggered_reason', '_reason_args')
+    
+    # Relative evaluation cost; AlertConditionSet checks cheaper conditions first
+    cost = 1
+    
     def __init__(self, name: str):
         self.name = name
         self.triggered_reason = ""
+        # Raw values for _format_reason, formatted into triggered_reason on first read. check()
+        # can set this instead of formatting eagerly, since most passes end in another
+        # condition failing.
+        self._reason_args = None
     
     @abstractmethod
     def check(self, data: MarketData) -> bool:
@@ -63,13 +149,23 @@ class AlertCondition(ABC):
         pass
     
     def get_trigger_reason(self) -> str:
-        """Return the reason why condition was triggered"""
+        """Return the reason why condition was triggered. Only meaningful after check() returned True."""
+        if self._reason_args is not None:
+            self.triggered_reason = self._format_reason(*self._reason_args)
+            self._reason_args = None
         return self.triggered_reason
+    
+    @abstractmethod
+    def _format_reason(self, *args) -> str:
+        """Build the reason text from the values check() stored in _reason_args"""
+        pass
 
 
 class PriceAboveVWAPCondition(AlertCondition):
     """Condition: Price is above VWAP"""
     
+    __slots__ = ()
+    
     def __init__(self):
         super().__init__("Price Above VWAP")
     
@@ -77,14 +173,17 @@ class PriceAboveVWAPCondition(AlertCondition):
         # If VWAP is 0, we treat it as "not available" and allow the trade
         # to avoid blocking trades when TWS doesn't provide VWAP
         if data.vwap <= 0:
+            self._reason_args = None
             self.triggered_reason = "VWAP N/A (0.0)"
             return True
             
         if data.price > data.vwap:
-            self.triggered_reason = f"Price ${data.price:.2f} > VWAP ${data.vwap:.2f}"
+            self._reason_args = (data.price, data.vwap)
             return True
-        self.triggered_reason = ""
         return False
+    
+    def _format_reason(self, price, vwap) -> str:
+        return f"Price ${price:.2f} > VWAP ${vwap:.2f}"
 
 
 class TwoStepMomentumCondition(AlertCondition):
@@ -95,72 +194,99 @@ class TwoStepMomentumCondition(AlertCondition):
     Also requires current price >= high of the last 10 seconds.
     """
     
+    __slots__ = ('t1', 't2', 'window', '_window_ns', '_double_window_ns')
+    
+    cost = 2  # a handful of bisects over the history
+    
     def __init__(self, t1: float = THRESH_1, t2: float = THRESH_2, window: int = WINDOW_SEC):
         super().__init__("Two-Step Momentum")
         self.t1 = t1
         self.t2 = t2
         self.window = window
+        # Window lengths in the history's clock, fixed for the life of the condition
+        self._window_ns = window * NS_PER_SEC
+        self._double_window_ns = 2 * self._window_ns
+    
+    @staticmethod
+    def _high_before(history: BarHistory, lo: int, cutoff: int) -> float:
+        """Rolling 10s high: max price from index `lo` up to (excluding) samples at or after `cutoff`"""
+        hi = history.bisect_left(cutoff, lo)
+        return max(islice(history.prices, lo, hi)) if hi > lo else 0
     
     def check(self, data: MarketData) -> bool:
-        if not data.price_history or len(data.price_history) < 2:
+        history = data.history
+        if not history or len(history) < 2:
             return False
             
-        now = data.timestamp
+        now = data.ts_ns
+        prices = history.prices
         
         # Define windows
-        w1_start = now - timedelta(seconds=self.window * 2)
-        w1_end = now - timedelta(seconds=self.window)
+        w1_start = now - self._double_window_ns
+        w1_end = now - self._window_ns
         w2_start = w1_end
         w2_end = now
         
-        # Get prices for each window
+        # Locate each window as a [lo, hi) index range in the time-ordered history
         # Use a small buffer for timestamp comparison to handle floating point/sampling issues
-        buffer = timedelta(milliseconds=100)
-        p_w1 = [p for ts, p in data.price_history.items() if w1_start - buffer <= ts <= w1_end + buffer]
-        p_w2 = [p for ts, p in data.price_history.items() if w2_start - buffer <= ts <= w2_end + buffer]
-        
-        # Rolling 10s high (excluding current price)
-        # We look at prices strictly before 'now'
-        p_prev_10s = [p for ts, p in data.price_history.items() if w1_start - buffer <= ts < now - buffer]
-        high_10s = max(p_prev_10s) if p_prev_10s else 0
+        buffer = 100_000_000  # 100ms
+        # Every later probe is at or after w1_start - buffer, so it only needs to search from w1_lo
+        w1_lo = history.bisect_left(w1_start - buffer)
+        w1_hi = history.bisect_right(w1_end + buffer, w1_lo)
+        w2_lo, w2_hi = history.bisect_left(w2_start - buffer, w1_lo), history.bisect_right(w2_end + buffer, w1_lo)
         
-        if not p_w1 or not p_w2:
+        if w1_lo >= w1_hi or w2_lo >= w2_hi:
             # If we don't have enough granular data (e.g. 10s bars in backtest),
             # we fallback to comparing current price vs 10s ago
-            p_10s_ago = [p for ts, p in data.price_history.items() if w1_start - buffer <= ts <= w1_start + buffer]
-            if p_10s_ago:
-                total_return = ((data.price - p_10s_ago[0]) / p_10s_ago[0]) * 100
+            if history.bisect_right(w1_start + buffer, w1_lo) > w1_lo:
+                p_10s_ago = prices[w1_lo]
+                total_return = ((data.price - p_10s_ago) / p_10s_ago) * 100
                 # If total return is > sum of thresholds, we consider it a potential trigger
-                if total_return >= (self.t1 + self.t2) and data.price >= high_10s:
+                if total_return < (self.t1 + self.t2):
+                    return False
+                high_10s = self._high_before(history, w1_lo, now - buffer)
+                if data.price >= high_10s:
                     r1 = self.t1 # Mock values for logging
                     r2 = total_return - self.t1
                 else: return False
             else: return False
         else:
             # r1 = return from (t-10s -> t-5s)
-            r1 = ((p_w1[-1] - p_w1[0]) / p_w1[0]) * 100 if len(p_w1) >= 1 else 0
+            r1 = ((prices[w1_hi - 1] - prices[w1_lo]) / prices[w1_lo]) * 100
             # r2 = return from (t-5s -> t)
-            r2 = ((data.price - p_w2[0]) / p_w2[0]) * 100 if len(p_w2) >= 1 else 0
+            r2 = ((data.price - prices[w2_lo]) / prices[w2_lo]) * 100
+            # The rolling high only matters once both returns qualify (or for the debug line)
+            if not (r1 >= self.t1 and r2 >= self.t2) and not (DEBUG_MOMENTUM and (r1 > 0.5 or r2 > 0.5)):
+                return False
+            high_10s = self._high_before(history, w1_lo, now - buffer)
         
         # Check conditions
         is_triggered = r1 >= self.t1 and r2 >= self.t2 and data.price >= high_10s
         
         # Debug logging for potential triggers
-        if r1 > 0.5 or r2 > 0.5:
+        if DEBUG_MOMENTUM and (r1 > 0.5 or r2 > 0.5):
             print(f"[DEBUG] {data.symbol} @ {data.timestamp.strftime('%H:%M:%S')} | r1: {r1:.2f}% (req: {self.t1}%), r2: {r2:.2f}% (req: {self.t2}%), Price: {data.price:.2f}, High10s: {high_10s:.2f}, Triggered: {is_triggered}")
 
         if is_triggered:
             # Calculate volume in last 10s if available
-            vol_10s = sum(v for ts, v in data.volume_history.items() if w1_start <= ts <= now) if data.volume_history else 0
+            vol_10s = history.volume_sum(history.bisect_left(w1_start, w1_lo), history.bisect_right(now, w1_lo))
             
-            self.triggered_reason = (
-                f"SIGNAL: r1={r1:.2f}%, r2={r2:.2f}% | "
-                f"Price: ${data.price:.2f} >= High10s: ${high_10s:.2f} | "
-                f"Vol10s: {vol_10s:,.0f}"
-            )
+            self._reason_args = (r1, r2, data.price, high_10s, vol_10s)
             return True
             
         return False
+    
+    def _format_reason(self, r1, r2, price, high_10s, vol_10s) -> str:
+        return (
+            f"SIGNAL: r1={r1:.2f}%, r2={r2:.2f}% | "
+            f"Price: ${price:.2f} >= High10s: ${high_10s:.2f} | "
+            f"Vol10s: {vol_10s:,.0f}"
+        )
+
+
+# Shared instance used by AlertConditionSet.check_all to word the mandatory VWAP reason
+_VWAP_CONDITION = PriceAboveVWAPCondition()
+
 
 def passes_spread_filter(best_bid: float, best_ask: float, price: float) -> bool:
     """
@@ -174,9 +300,32 @@ def passes_spread_filter(best_bid: float, best_ask: float, price: float) -> bool
     return spread_pct <= MAX_SPREAD_PCT
 
 
+def _bucket_volumes(timestamps, cum_volumes, start: int, span: int) -> list:
+    """
+    Sum the volumes from index `start` on into consecutive windows, each covering
+    at most `span` after its first sample. The trailing window is dropped if its
+    volume is 0. Each window's end is found by bisect and its total read off the
+    running sums in `cum_volumes` (see BarHistory).
+    """
+    windows = []
+    n = len(timestamps)
+    i = start
+    while i < n:
+        j = bisect_right(timestamps, timestamps[i] + span, i + 1, n)
+        windows.append(cum_volumes[j] - cum_volumes[i])
+        i = j
+    if windows and windows[-1] <= 0:
+        windows.pop()
+    return windows
+
+
 class VolumeSpike10sCondition(AlertCondition):
     """Condition: Current 10s volume > 5x average of past twenty 10s bars"""
     
+    __slots__ = ('spike_threshold',)
+    
+    cost = 3  # walks the whole history to bucket it
+    
     def __init__(self, spike_threshold: float = VOLUME_SURGE_THRESHOLD):
         """
         Args:
@@ -186,40 +335,20 @@ class VolumeSpike10sCondition(AlertCondition):
         self.spike_threshold = spike_threshold
     
     def check(self, data: MarketData) -> bool:
-        if not data.volume_history or len(data.volume_history) < 21:
-            self.triggered_reason = ""
+        if not data.history or len(data.history) < 21:
             return False
         
-        now = data.timestamp
-        
-        # Group volumes into 10-second windows
-        ten_sec_windows = []
-        sorted_times = sorted(data.volume_history.keys())
-        
-        current_window_start = None
-        current_window_vol = 0
-        
-        for ts in sorted_times:
-            vol = data.volume_history[ts]
-            
-            if current_window_start is None:
-                current_window_start = ts
-                current_window_vol = vol
-            elif (ts - current_window_start).total_seconds() <= 10:
-                current_window_vol += vol
-            else:
-                # Close current window and start new one
-                ten_sec_windows.append(current_window_vol)
-                current_window_start = ts
-                current_window_vol = vol
+        history = data.history
+        # Each new window starts more than 10s after the previous one, so 21 windows
+        # need the history to span over 200s; skip the bucketing when it cannot
+        if history.timestamps[-1] - history.timestamps[history.start] <= 20 * 10 * NS_PER_SEC:
+            return False
         
-        # Add the last window
-        if current_window_vol > 0:
-            ten_sec_windows.append(current_window_vol)
+        # Group volumes into 10-second windows (history is already time-ordered)
+        ten_sec_windows = _bucket_volumes(history.timestamps, history.cum_volumes, history.start, 10 * NS_PER_SEC)
         
         # Need at least 21 windows (20 past + 1 current)
         if len(ten_sec_windows) < 21:
-            self.triggered_reason = ""
             return False
         
         # Current 10s volume (most recent window)
@@ -229,41 +358,47 @@ class VolumeSpike10sCondition(AlertCondition):
         past_20_avg = sum(ten_sec_windows[-21:-1]) / 20
         
         if past_20_avg == 0:
-            self.triggered_reason = ""
             return False
         
         ratio = current_10s_vol / past_20_avg
         
         if ratio >= self.spike_threshold:
-            self.triggered_reason = (
-                f"10s volume spike {ratio:.1f}x (current: {current_10s_vol:.0f} vs avg: {past_20_avg:.0f})"
-            )
+            self._reason_args = (ratio, current_10s_vol, past_20_avg)
             return True
         
-        self.triggered_reason = ""
         return False
+    
+    def _format_reason(self, ratio, current_10s_vol, past_20_avg) -> str:
+        return f"10s volume spike {ratio:.1f}x (current: {current_10s_vol:.0f} vs avg: {past_20_avg:.0f})"
 
 
 class VolumeConfirmationCondition(AlertCondition):
     """Condition: Volume is sustained. Current 10s volume and previous 10s volume are both > 2x average."""
     
+    __slots__ = ('multiplier',)
+    
     def __init__(self, multiplier: float = 2.0):
         super().__init__("Volume Confirmation (Sustained)")
         self.multiplier = multiplier
     
     def check(self, data: MarketData) -> bool:
-        if not data.volume_history or len(data.volume_history) < 22:
+        if not data.history or len(data.history) < 22:
             return False
         
-        sorted_vols = [v for k, v in sorted(data.volume_history.items())]
-        current_vol = sorted_vols[-1]
-        prev_vol = sorted_vols[-2]
-        avg_vol = sum(sorted_vols[-22:-2]) / 20
+        history = data.history
+        vols = history.volumes
+        current_vol = vols[-1]
+        prev_vol = vols[-2]
+        # Mean of the 20 samples before those two, from the running volume total
+        avg_vol = (history.cum_volumes[-3] - history.cum_volumes[-23]) / 20
         
         if avg_vol > 0 and current_vol > (avg_vol * self.multiplier) and prev_vol > (avg_vol * self.multiplier):
-            self.triggered_reason = f"Sustained volume: Current {current_vol/avg_vol:.1f}x, Prev {prev_vol/avg_vol:.1f}x"
+            self._reason_args = (current_vol, prev_vol, avg_vol)
             return True
         return False
+    
+    def _format_reason(self, current_vol, prev_vol, avg_vol) -> str:
+        return f"Sustained volume: Current {current_vol/avg_vol:.1f}x, Prev {prev_vol/avg_vol:.1f}x"
 
 
 class AlertConditionSet:
@@ -271,14 +406,46 @@ class AlertConditionSet:
     
     def __init__(self, name: str):
         self.name = name
+        # Optional conditions only; the VWAP gate is built into check_all
         self.conditions: list[AlertCondition] = []
+        # Rebound to a new list on every check_all, so callers may keep a reference
         self.triggered_reasons: list[str] = []
+        # Bound methods of the conditions, resolved once here instead of per check_all:
+        # checks run cheapest first, reasons are collected in the order conditions were added
+        self._checks: tuple = ()
+        self._reason_getters: tuple = ()
     
     def add_condition(self, condition: AlertCondition) -> 'AlertConditionSet':
         """Add a condition to the set. Returns self for chaining."""
+        # VWAP is enforced by check_all itself, so adding it again is a no-op
+        if isinstance(condition, PriceAboveVWAPCondition):
+            return self
         self.conditions.append(condition)
+        self._checks = tuple(c.check for c in sorted(self.conditions, key=lambda c: c.cost))
+        self._reason_getters = tuple(c.get_trigger_reason for c in self.conditions)
         return self
     
+    @staticmethod
+    def prefilter_batch(prices, vwaps, bids=None, asks=None) -> list[bool]:
+        """
+        Evaluate the mandatory VWAP and spread gates for many bars (or symbols) at once.
+        The gates are the same for every set, so this can also be called on the class.
+        
+        Args:
+            prices, vwaps: Per-bar price and VWAP sequences
+            bids, asks: Optional per-bar quotes; the spread gate is skipped without them
+            
+        Returns:
+            list[bool]: True where a bar passes the gates and check_all is worth running
+        """
+        mask = [vwap <= 0 or price > vwap for price, vwap in zip(prices, vwaps)]
+        if bids is not None and asks is not None:
+            mask = [
+                ok and passes_spread_filter(bid, ask, price)
+                for ok, bid, ask, price in zip(mask, bids, asks, prices)
+            ]
+        return mask
+    
     def check_all(self, data: MarketData) -> bool:
         """
         Check if ALL conditions are met.
@@ -291,33 +458,25 @@ class AlertConditionSet:
         """
         self.triggered_reasons = []
         
-        # MANDATORY: Price must be above VWAP for any alert to trigger
-        vwap_cond = PriceAboveVWAPCondition()
-        if not vwap_cond.check(data):
-            if data.symbol.lower() == "cgtl":
-                print(f"[DEBUG] {data.symbol} @ {data.timestamp.strftime('%H:%M:%S')} failed VWAP: Price {data.price} <= VWAP {data.vwap}")
-            return False
-            
-        # MANDATORY: Spread filter
-        if not passes_spread_filter(data.bid, data.ask, data.price):
-            if data.symbol.lower() == "cgtl":
-                print(f"[DEBUG] {data.symbol} @ {data.timestamp.strftime('%H:%M:%S')} failed Spread: Bid {data.bid}, Ask {data.ask}, Price {data.price}")
+        # MANDATORY gates, fused into one expression over locals:
+        # price above VWAP (VWAP of 0 = not available, as in PriceAboveVWAPCondition; its
+        # reason is only formatted once an alert fires) and spread within MAX_SPREAD_PCT
+        # (missing quotes pass, as in passes_spread_filter)
+        price, vwap, bid, ask = data.price, data.vwap, data.bid, data.ask
+        if not ((vwap <= 0 or price > vwap)
+                and (bid <= 0 or ask <= 0 or price <= 0 or ((ask - bid) / price) * 100 <= MAX_SPREAD_PCT)):
             return False
             
-        # Check all other conditions in the set
-        for condition in self.conditions:
-            # Skip if it's already the VWAP condition (to avoid double checking)
-            if isinstance(condition, PriceAboveVWAPCondition):
-                continue
-                
-            if condition.check(data):
-                self.triggered_reasons.append(condition.get_trigger_reason())
-            else:
+        # Check all other conditions in the set, stopping at the first failure
+        for check in self._checks:
+            if not check(data):
                 return False
+        reasons = self.triggered_reasons = [get_reason() for get_reason in self._reason_getters]
         
         # Add VWAP reason at the beginning if other conditions also met
-        if self.triggered_reasons:
-            self.triggered_reasons.insert(0, vwap_cond.get_trigger_reason())
+        if reasons:
+            _VWAP_CONDITION.check(data)
+            reasons.insert(0, _VWAP_CONDITION.get_trigger_reason())
             return True
             
         return False
@@ -1,7 +1,9 @@
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from collections import deque
+from dataclasses import replace
+from typing import Dict, NamedTuple, Optional
 import sys
 import signal
 import pyttsx3
@@ -10,6 +12,10 @@ from conditions import (
     AlertCondition,
     AlertConditionSet,
     MarketData,
+    BarHistory,
+    to_ns,
+    from_ns,
+    NS_PER_SEC,
     PriceAboveVWAPCondition,
     TwoStepMomentumCondition,
     VolumeSpike10sCondition,
@@ -20,12 +26,22 @@ from conditions import (
 
 # Import TWS integration - REQUIRED
 try:
-    from tws_data_fetcher import create_tws_data_app, TWSDataApp
+    from tws_data_fetcher import create_tws_data_app, TWSDataApp, HISTORICAL_WORKERS
 except ImportError:
     print("[Error] tws_data_fetcher.py not found. Please ensure it is in the same directory.")
     sys.exit(1)
 
 
+class QuoteSnapshot(NamedTuple):
+    """Latest scalar state of a monitor, published as one immutable tuple"""
+    price: float
+    vwap: Optional[float]  # cumulative day VWAP; None until there is traded volume
+    bid: float
+    ask: float
+    bar_volume: float  # incremental volume of the last update
+    update_ns: int  # time.monotonic_ns() of the last update
+
+
 class RealtimeSymbolMonitor:
     """Monitors a single symbol in real-time and checks conditions"""
     
@@ -33,9 +49,9 @@ class RealtimeSymbolMonitor:
         self.symbol = symbol
         self.condition_set = condition_set
         
-        # Data tracking
-        self.price_history = deque(maxlen=max_history_size)
-        self.volume_history = deque(maxlen=max_history_size)
+        # Data tracking: time-ordered (int ns timestamp, price, volume increment) samples,
+        # handed to the conditions as-is on every check
+        self.history = BarHistory(max_history_size)
         
         # Cumulative VWAP tracking (like Webull)
         self.cumulative_pv = 0.0  # Sum of (price * volume)
@@ -47,90 +63,141 @@ class RealtimeSymbolMonitor:
         self.last_bar_volume = None  # Last bar's incremental volume
         self.last_bid = 0.0
         self.last_ask = 0.0
-        self.last_update = None
+        self.last_update_ns = None  # time.monotonic_ns() of the last update
+        # Add to a monotonic_ns() reading to get wall-clock ns on the to_ns scale
+        self.wall_offset_ns = to_ns(datetime.now()) - time.monotonic_ns()
+        # Guards the history and cumulative state, which change in several steps per update
         self.lock = threading.Lock()
+        # Replaced wholesale at the end of each update, so readers that only need the
+        # latest quote can read this one attribute without taking the lock
+        self.snapshot: Optional[QuoteSnapshot] = None
+        # Scratch MarketData refreshed in place by each check_conditions (as in the backtest);
+        # conditions only read it during check_all, and an alert gets its own copy
+        self._md = MarketData(symbol=symbol, price=0.0, volume=0.0, vwap=0.0,
+                              timestamp=None, history=self.history)
+        # Result of the last check_conditions and the update it saw (see there)
+        self._checked_ns: Optional[int] = None
+        self._checked_result: Optional[MarketData] = None
+        # Optional threading.Event set after every update (the scanner's wake-up signal)
+        self.updated: Optional[threading.Event] = None
         
         # Alert tracking
         self.last_alert_time = None
     
     def update_market_data(self, price: float, volume: int, vwap: float = None, bid: float = None, ask: float = None):
-        """Update market data for this symbol"""
+        """Update market data for this symbol (volume is the cumulative daily volume)"""
         with self.lock:
-            timestamp = datetime.now()
-            
             # Convert to float (TWS returns Decimal types)
-            price = float(price)
             volume = float(volume)
-            if bid is not None: self.last_bid = float(bid)
-            if ask is not None: self.last_ask = float(ask)
             
-            # For tick-by-tick updates, volume is cumulative daily volume
             # Calculate incremental volume for this update
             if self.last_volume is not None:
                 volume_increment = volume - self.last_volume
             else:
                 volume_increment = volume
-            
-            # Update cumulative VWAP (like Webull)
-            if volume_increment > 0:
-                self.cumulative_pv += price * volume_increment
-                self.cumulative_volume += volume_increment
-                if self.cumulative_volume > 0:
-                    self.last_vwap = self.cumulative_pv / self.cumulative_volume
-            
-            self.price_history.append((timestamp, price))
-            self.volume_history.append((timestamp, volume_increment))
-            
-            self.last_price = price
             self.last_volume = volume  # Store cumulative volume
-            self.last_bar_volume = volume_increment  # Store this bar's volume
-            self.last_update = timestamp
+            
+            self._record(price, volume_increment, bid, ask)
+        if self.updated is not None:
+            self.updated.set()
+    
+    def update_trade(self, price: float, size: float, bid: float = None, ask: float = None):
+        """Record a single trade of `size` shares (tick-by-tick data: one update per trade)"""
+        with self.lock:
+            self._record(price, float(size), bid, ask)
+        if self.updated is not None:
+            self.updated.set()
+    
+    def _record(self, price, volume_increment: float, bid, ask):
+        """Append one update to the history and publish its snapshot. Caller holds self.lock."""
+        # Monotonic integer clock; converted to wall time only for display (last_update)
+        ts_ns = time.monotonic_ns()
+        
+        # Convert to float (TWS returns Decimal types)
+        price = float(price)
+        if bid is not None: self.last_bid = float(bid)
+        if ask is not None: self.last_ask = float(ask)
+        
+        # Update cumulative VWAP (like Webull)
+        if volume_increment > 0:
+            self.cumulative_pv += price * volume_increment
+            self.cumulative_volume += volume_increment
+            if self.cumulative_volume > 0:
+                self.last_vwap = self.cumulative_pv / self.cumulative_volume
+        
+        self.history.append(ts_ns, price, volume_increment)
+        
+        self.last_price = price
+        self.last_bar_volume = volume_increment  # Store this bar's volume
+        self.last_update_ns = ts_ns
+        self.snapshot = QuoteSnapshot(price, self.last_vwap, self.last_bid, self.last_ask,
+                                      volume_increment, ts_ns)
+    
+    def on_tick(self, symbol, price, volume, vwap, timestamp, bid=None, ask=None):
+        """TWS market data callback bound to this monitor (same arguments as the scanner's)"""
+        self.update_market_data(price, volume, vwap, bid, ask)
+    
+    def on_trade(self, symbol, price, size, vwap, timestamp, bid=None, ask=None):
+        """TWS tick-by-tick callback bound to this monitor (size is the one trade's shares)"""
+        self.update_trade(price, size, bid, ask)
+    
+    @property
+    def last_update(self) -> Optional[datetime]:
+        """Wall-clock time of the last update, derived from last_update_ns"""
+        if self.last_update_ns is None:
+            return None
+        return from_ns(self.last_update_ns + self.wall_offset_ns)
     
     def check_conditions(self) -> Optional[MarketData]:
         """Check if all conditions are met for this symbol"""
         with self.lock:
             if self.last_price is None:
                 return None
+            # Conditions depend only on the data up to the last update, so with no update
+            # since the previous check its result still stands (the loop polls every second,
+            # far more often than a quiet symbol ticks)
+            if self.last_update_ns == self._checked_ns:
+                return self._checked_result
             
-            # Convert history deques to dicts
-            price_dict = {ts: price for ts, price in self.price_history}
-            volume_dict = {ts: vol for ts, vol in self.volume_history}
+            # history is shared by reference: conditions run under the lock, so no copy
+            md = self._md
+            md.price = self.last_price
+            md.volume = self.last_bar_volume
+            md.vwap = self.last_vwap or 0.0  # 0 means VWAP not available yet
+            md.timestamp = self.last_update
+            md.bid = self.last_bid
+            md.ask = self.last_ask
+            md.ts_ns = self.last_update_ns
             
-            md = MarketData(
-                symbol=self.symbol,
-                price=self.last_price,
-                volume=self.last_bar_volume,
-                vwap=self.last_vwap,
-                timestamp=self.last_update,
-                bid=self.last_bid,
-                ask=self.last_ask,
-                price_history=price_dict,
-                volume_history=volume_dict
-            )
-            
-            if self.condition_set.check_all(md):
-                return md
-            return None
+            # On a hit, detach from the scratch instance, which the next check overwrites, and
+            # from the live history, which the TWS thread keeps changing outside the caller's
+            # view of self.lock (alert callbacks only read the quote fields)
+            result = replace(md, history=None) if self.condition_set.check_all(md) else None
+            self._checked_ns = self.last_update_ns
+            self._checked_result = result
+            return result
 
     def get_volume_spike_ratio(self) -> float:
         """Calculate volume spike ratio (current 10s vs avg of past 20 bars)"""
         with self.lock:
-            if not self.volume_history or len(self.volume_history) < 50:
+            history = self.history
+            if len(history) < 50:
                 return 0.0
             
-            now = datetime.now()
+            now = time.monotonic_ns()
+            ten_sec = 10 * NS_PER_SEC
+            
+            # Windows are located by bisecting the time-ordered history, and summed
+            # from its running volume total, rather than scanning every sample
+            cur_lo = history.bisect_left(now - ten_sec)
+            past_lo = history.bisect_left(now - 21 * ten_sec)
+            end = len(history.timestamps)
             
             # Get volume in last 10 seconds (current window)
-            current_10s_vol = sum(
-                vol for ts, vol in self.volume_history
-                if (now - ts).total_seconds() <= 10
-            )
+            current_10s_vol = history.volume_sum(cur_lo, end)
             
             # Get volume in previous 200 seconds (20 x 10s bars)
-            past_200s_vol = sum(
-                vol for ts, vol in self.volume_history
-                if 10 < (now - ts).total_seconds() <= 210
-            )
+            past_200s_vol = history.volume_sum(past_lo, cur_lo)
             
             past_20_avg = past_200s_vol / 20
             
@@ -147,11 +214,23 @@ class RealtimeAlertScanner:
         self.monitors: Dict[str, RealtimeSymbolMonitor] = {}
         self.alert_callbacks = []
         self.alert_cooldown = timedelta(seconds=30)
-        self.last_alert_time = {s: None for s in symbols}
+        self.last_alert_ns: Dict[str, Optional[int]] = {s: None for s in symbols}  # time.monotonic_ns()
+        # Set by any monitor update; wakes the monitoring loop in start()
+        self._tick_event = threading.Event()
         
         # Initialize monitors with default conditions
         self._initialize_monitors()
     
+    @property
+    def alert_cooldown(self) -> timedelta:
+        return self._alert_cooldown
+    
+    @alert_cooldown.setter
+    def alert_cooldown(self, value: timedelta):
+        # Keep an integer-nanosecond copy for the per-check cooldown test
+        self._alert_cooldown = value
+        self._cooldown_ns = int(value.total_seconds() * NS_PER_SEC)
+    
     def _initialize_monitors(self):
         """Initialize monitors with default condition set"""
         for symbol in self.symbols:
@@ -162,6 +241,7 @@ class RealtimeAlertScanner:
             condition_set.add_condition(VolumeSpike10sCondition())  
             
             self.monitors[symbol] = RealtimeSymbolMonitor(symbol, condition_set)
+            self.monitors[symbol].updated = self._tick_event
     
     def load_today_historical_bars(self, tws_app, bar_size: str = "5 mins"):
         """
@@ -170,10 +250,17 @@ class RealtimeAlertScanner:
         """
         print(f"\n[INFO] Loading today's historical data for {len(self.symbols)} symbols...")
         
-        for symbol in self.symbols:
-            # Fetch bars from today's open
-            bars = tws_app.fetch_historical_bars(symbol, duration="1 D", bar_size=bar_size)
-            
+        # Fetch bars from today's open. Each request is a TWS round-trip with its own
+        # reqId, so issue them concurrently, bounded to stay within IBKR's historical-data
+        # pacing (results come back in symbol order)
+        end_date = datetime.now()
+        with ThreadPoolExecutor(max_workers=HISTORICAL_WORKERS) as ex:
+            fetched = list(ex.map(
+                lambda s: tws_app.fetch_historical_bars(s, end_date, duration="1 D", bar_size=bar_size),
+                self.symbols
+            ))
+        
+        for symbol, bars in zip(self.symbols, fetched):
             if bars:
                 print(f"  - {symbol}: Loaded {len(bars)} bars")
                 monitor = self.monitors[symbol]
@@ -182,9 +269,9 @@ class RealtimeAlertScanner:
                 # We use the 'average' price for VWAP baseline
                 for bar in bars:
                     monitor.update_market_data(
-                        price=bar['close'],
-                        volume=bar['volume'],
-                        vwap=bar['average']
+                        price=bar.close,
+                        volume=bar.volume,
+                        vwap=bar.average
                     )
             else:
                 print(f"  - {symbol}: No historical data found")
@@ -193,43 +280,72 @@ class RealtimeAlertScanner:
         """Register a callback for alerts"""
         self.alert_callbacks.append(callback)
     
-    def start(self, tws_app):
-        """Start the real-time scanning loop"""
+    def start(self, tws_app, tick_by_tick: bool = False):
+        """
+        Start the real-time scanning loop. With tick_by_tick, every trade is delivered
+        as it happens instead of in reqMktData's ~250 ms snapshots (IBKR limits how many
+        symbols can be streamed this way).
+        """
         print(f"\n[INFO] Starting real-time scan for: {', '.join(self.symbols)}")
         
-        # 1. Subscribe to real-time market data
-        for symbol in self.symbols:
-            tws_app.subscribe_market_data(symbol, self._market_data_callback)
+        # 1. Subscribe to real-time market data. Each subscription calls its symbol's
+        # monitor directly, so a tick needs no symbol lookup
+        if tick_by_tick:
+            for symbol in self.symbols:
+                tws_app.subscribe_tick_by_tick(symbol, self.monitors[symbol].on_trade)
+        else:
+            tws_app.subscribe_market_data_many(
+                {symbol: self.monitors[symbol].on_tick for symbol in self.symbols}
+            )
         
-        # 2. Main monitoring loop
+        # 2. Main monitoring loop: check as soon as any tick arrives (ticks that land
+        # during a pass are picked up together by the next one), and at least every
+        # second so alert cooldowns still expire while quotes are quiet
+        tick_event = self._tick_event
         try:
             while True:
+                tick_event.wait(1.0)
+                tick_event.clear()
                 self._check_all_monitors()
-                time.sleep(1)  # Check every second
         except KeyboardInterrupt:
             print("\n[INFO] Stopping scanner...")
         finally:
             for symbol in self.symbols:
                 tws_app.unsubscribe_market_data(symbol)
 
-    def _market_data_callback(self, symbol, price, volume, vwap, timestamp):
-        """Callback for TWS market data updates"""
-        if symbol in self.monitors:
-            # In a real scenario, we would also get bid/ask from TWS
-            # For now, we pass None for bid/ask as they are not yet implemented in tws_data_fetcher
-            self.monitors[symbol].update_market_data(price, volume, vwap)
+    def _market_data_callback(self, symbol, price, volume, vwap, timestamp, bid=None, ask=None):
+        """
+        Route a TWS market data update to its symbol's monitor (start() subscribes each
+        monitor's on_tick directly; this is for callers that deliver ticks by symbol).
+        Only records the tick; conditions are evaluated for all symbols once per pass of
+        the monitoring loop in start(), so a burst of ticks costs one check, not one per tick.
+        """
+        monitor = self.monitors.get(symbol)
+        if monitor is not None:
+            monitor.update_market_data(price, volume, vwap, bid, ask)
 
     def _check_all_monitors(self):
         """Check conditions for all monitored symbols"""
-        for symbol, monitor in self.monitors.items():
+        # Apply the mandatory VWAP/spread gates to every symbol's latest quote in one pass,
+        # then run the full (history-based) check only for symbols that pass them
+        live = [(s, m, q) for s, m in self.monitors.items() if (q := m.snapshot) is not None]
+        gates = AlertConditionSet.prefilter_batch(
+            [q.price for _, _, q in live],
+            [q.vwap or 0.0 for _, _, q in live],
+            [q.bid for _, _, q in live],
+            [q.ask for _, _, q in live],
+        )
+        for (symbol, monitor, _), passed in zip(live, gates):
+            if not passed:
+                continue
             md = monitor.check_conditions()
             
             if md:
-                now = datetime.now()
-                last_alert = self.last_alert_time[symbol]
+                now = time.monotonic_ns()
+                last_alert = self.last_alert_ns[symbol]
                 
-                if last_alert is None or (now - last_alert) >= self.alert_cooldown:
-                    self.last_alert_time[symbol] = now
+                if last_alert is None or now - last_alert >= self._cooldown_ns:
+                    self.last_alert_ns[symbol] = now
                     reasons = monitor.condition_set.get_trigger_summary()
                     
                     # Trigger all callbacks
@@ -237,50 +353,69 @@ class RealtimeAlertScanner:
                         callback(symbol, md.timestamp, reasons, md)
 
 
+# ANSI: erase the screen and move the cursor home
+_CLEAR_SCREEN = "\x1b[2J\x1b[H"
+
+# Fixed top of the status table, formatted once at import rather than on every refresh
+_TABLE_HEADER = (
+    "="*105,
+    f"{'STOCK REAL-TIME SCANNER':^105}",
+    "="*105,
+    f"{'SYMBOL':<8} | {'PRICE':<10} | {'VWAP':<10} | {'VOL SPIKE':<10} | {'LAST UPDATE':<20} | {'STATUS'}",
+    "-" * 105,
+)
+# Row for a symbol that has not ticked yet; format() fills in the symbol
+_WAITING_ROW = "{:<8}" + f" | {'WAITING...':<10} | {'WAITING...':<10} | {'0.0x':<10} | {'N/A':<20} | OK"
+
+
 def display_status_table(scanner, alerts_list=None):
     """Display a real-time status table of all monitored symbols"""
     import os
-    os.system('cls' if os.name == 'nt' else 'clear')
-    
-    print("="*105)
-    print(f"{'STOCK REAL-TIME SCANNER':^105}")
-    print("="*105)
-    print(f"{'SYMBOL':<8} | {'PRICE':<10} | {'VWAP':<10} | {'VOL SPIKE':<10} | {'LAST UPDATE':<20} | {'STATUS'}")
-    print("-" * 105)
+    # The table is assembled in memory and written in one go, so a refresh holds the
+    # GIL for one write instead of a print per line while ticks are arriving
+    out = list(_TABLE_HEADER)
+    if os.name == 'nt':
+        os.system('cls')
+    else:
+        # Clear with an escape sequence in the same write instead of running `clear`
+        out[0] = _CLEAR_SCREEN + out[0]
     
     for symbol in scanner.symbols:
         monitor = scanner.monitors[symbol]
-        with monitor.lock:
-            try:
-                price = f"${monitor.last_price:.2f}" if monitor.last_price else "WAITING..."
-                vwap = f"${monitor.last_vwap:.2f}" if monitor.last_vwap else "WAITING..."
-                spike = f"{monitor.get_volume_spike_ratio():.1fx}"
-                update = monitor.last_update.strftime("%H:%M:%S") if monitor.last_update else "N/A"
-                
-                # Simple status indicator
-                status = "OK"
-                if monitor.last_price and monitor.last_vwap:
-                    if monitor.last_price > monitor.last_vwap:
-                        status = "🟢 ABOVE VWAP"
-                    else:
-                        status = "🔴 BELOW VWAP"
-                
-                print(f"{symbol:<8} | {price:<10} | {vwap:<10} | {spike:<10} | {update:<20} | {status}")
-            except Exception as e:
-                print(f"{symbol:<8} ERROR: {str(e)[:50]}")
+        # One lock-free read of the latest quote (get_volume_spike_ratio locks on its own)
+        q = monitor.snapshot
+        if q is None:
+            # No tick yet, so the row is fixed apart from the symbol
+            out.append(_WAITING_ROW.format(symbol))
+            continue
+        price = f"${q.price:.2f}" if q.price else "WAITING..."
+        vwap = f"${q.vwap:.2f}" if q.vwap else "WAITING..."
+        spike = f"{monitor.get_volume_spike_ratio():.1f}x"
+        update = from_ns(q.update_ns + monitor.wall_offset_ns).strftime("%H:%M:%S")
+        
+        # Simple status indicator
+        if q.price and q.vwap:
+            status = "🟢 ABOVE VWAP" if q.price > q.vwap else "🔴 BELOW VWAP"
+        else:
+            status = "OK"
+        
+        out.append(f"{symbol:<8} | {price:<10} | {vwap:<10} | {spike:<10} | {update:<20} | {status}")
     
-    print("-"*105)
+    out.append("-"*105)
     
     # Show last 7 alerts if present
     if alerts_list and len(alerts_list) > 0:
-        print("\n" + "!"*105)
-        print(f"🚨 RECENT ALERTS (Last {len(alerts_list)} triggers, most recent first) 🚨")
-        print("!"*105)
+        out.append("\n" + "!"*105)
+        out.append(f"🚨 RECENT ALERTS (Last {len(alerts_list)} triggers, most recent first) 🚨")
+        out.append("!"*105)
         for alert in list(alerts_list):
-            print(alert)
-            print("-"*105)
-        print("!"*105)
-    print("\n[INFO] Table updates every 5 seconds | Press Ctrl+C to stop\n")
+            out.append(alert)
+            out.append("-"*105)
+        out.append("!"*105)
+    out.append("\n[INFO] Table updates every 5 seconds | Press Ctrl+C to stop\n")
+    
+    sys.stdout.write("\n".join(out) + "\n")
+    sys.stdout.flush()
 
 
 # Example usage
@@ -309,15 +444,34 @@ if __name__ == "__main__":
     last_alerts = deque(maxlen=7)  # Stores alert messages (increased to 7)
     last_alert_triggered = False
 
-    tts_engine = pyttsx3.init()
+    # Voice announcements run on their own thread: runAndWait blocks for as long as the
+    # speech lasts, which would otherwise stall the scan loop that calls alert_handler
+    import queue
+    tts_queue = queue.Queue()
+    tts_pending = set()  # symbols queued but not yet spoken, so a burst is announced once
 
-    def alert_handler(symbol, timestamp, reasons, data):
-        # 1. Voice announce the symbol name
+    def tts_worker():
         try:
-            tts_engine.say(symbol)
-            tts_engine.runAndWait()
+            tts_engine = pyttsx3.init()
         except Exception as e:
             print(f"[Voice Error] {e}")
+            return
+        while True:
+            symbol = tts_queue.get()
+            tts_pending.discard(symbol)
+            try:
+                tts_engine.say(symbol)
+                tts_engine.runAndWait()
+            except Exception as e:
+                print(f"[Voice Error] {e}")
+
+    threading.Thread(target=tts_worker, daemon=True).start()
+
+    def alert_handler(symbol, timestamp, reasons, data):
+        # 1. Voice announce the symbol name (spoken by the voice thread)
+        if symbol not in tts_pending:
+            tts_pending.add(symbol)
+            tts_queue.put(symbol)
         # 2. Display in console (handled by table update)
         # 3. Add to last_alerts
         alert_msg = (
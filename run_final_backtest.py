@@ -36,28 +36,28 @@ def run():
     print("\n[INFO] Running backtest with 60s cooldown and Volume Confirmation...", flush=True)
     alerts = scanner.run_backtest()
     
+    # Each report section is assembled first and written with a single flushed print
     # 1. DETAILED ALERT LOG
-    print("\n" + "="*80, flush=True)
-    print(f"{'DETAILED ALERT LOG':^80}", flush=True)
-    print("="*80, flush=True)
+    out = ["\n" + "="*80, f"{'DETAILED ALERT LOG':^80}", "="*80]
     
     for symbol in SYMBOLS:
-        print(f"\n>>> {symbol}", flush=True)
+        out.append(f"\n>>> {symbol}")
         symbol_alerts = alerts.get(symbol, [])
         if not symbol_alerts:
-            print("    No alerts triggered.", flush=True)
+            out.append("    No alerts triggered.")
         else:
-            for i, alert in enumerate(symbol_alerts):
-                print(f"    [{i+1}] {alert.timestamp.strftime('%H:%M:%S')} | Price: ${alert.price:.2f} | VWAP: ${alert.vwap:.2f}", flush=True)
+            out.extend(
+                f"    [{i+1}] {alert.timestamp:%H:%M:%S} | Price: ${alert.price:.2f} | VWAP: ${alert.vwap:.2f}"
+                for i, alert in enumerate(symbol_alerts)
+            )
+    print("\n".join(out), flush=True)
     
     # 2. WIN RATE SUMMARY
-    print("\n" + "="*80, flush=True)
-    print(f"{'WIN RATE SUMMARY (2:1 Reward-to-Risk)':^80}", flush=True)
-    print("="*80, flush=True)
+    out = ["\n" + "="*80, f"{'WIN RATE SUMMARY (2:1 Reward-to-Risk)':^80}", "="*80]
     
     header = f"{'SCENARIO':<20} | {'SYMBOL':<10} | {'ALERTS':<8} | {'WINS':<6} | {'LOSSES':<8} | {'WIN RATE':<10} | {'FINAL ASSET':<12}"
-    print(header, flush=True)
-    print("-" * 100, flush=True)
+    out.append(header)
+    out.append("-" * 100)
     
     for tp, sl in SCENARIOS:
         # Reset assets for each scenario to start fresh with $10000
@@ -65,8 +65,8 @@ def run():
         pl_results = scanner.calculate_pl(tp, sl)
         for symbol in SYMBOLS:
             res = pl_results.get(symbol, [])
-            wins = len([r for r in res if r['outcome'] == "WIN"])
-            losses = len([r for r in res if r['outcome'] == "LOSS"])
+            wins = len([r for r in res if r.outcome == "WIN"])
+            losses = len([r for r in res if r.outcome == "LOSS"])
             total = wins + losses
             wr = (wins / total * 100) if total > 0 else 0
             
@@ -74,8 +74,9 @@ def run():
             final_asset = scanner.current_assets[symbol]
             
             row = f"TP:{tp:>4.1f}% / SL:{sl:>4.1f}% | {symbol:<10} | {len(res):<8} | {wins:<6} | {losses:<8} | {wr:>8.1f}% | ${final_asset:>10.2f}"
-            print(row, flush=True)
-        print("-" * 100, flush=True)
+            out.append(row)
+        out.append("-" * 100)
+    print("\n".join(out), flush=True)
     
     print("\n[INFO] Backtest complete. Disconnecting...", flush=True)
     tws_app.disconnect()
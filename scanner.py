@@ -16,9 +16,9 @@ Notes:
 """
 
 
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from tws_data_fetcher import create_tws_data_app
+from tws_data_fetcher import create_tws_data_app, HISTORICAL_WORKERS
 from ibapi.scanner import ScannerSubscription
 
 
@@ -38,30 +38,7 @@ def fetch_top_gainer_symbols(app, rows=SCANNER_ROWS):
     """
     from ibapi.scanner import ScannerSubscription
     symbols = []
-    done = [False]
-
-
-    def scanner_callback(reqId, rank, contractDetails):
-        # contractDetails is a ContractDetails object, not an int
-        try:
-            symbol = contractDetails.contract.symbol
-            if symbol not in symbols:
-                symbols.append(symbol)
-        except Exception:
-            pass
-
-    def scanner_end(reqId):
-        done[0] = True
-
-    # Attach callbacks
-
-    # Patch the app's scannerData and scannerDataEnd methods
-    def patched_scannerData(reqId, rank, contractDetails, distance, benchmark, projection, legsStr):
-        scanner_callback(reqId, rank, contractDetails)
-    def patched_scannerDataEnd(reqId):
-        scanner_end(reqId)
-    app.scannerData = patched_scannerData
-    app.scannerDataEnd = patched_scannerDataEnd
+    seen = set()
 
     scan_sub = ScannerSubscription()
     scan_sub.instrument = "STK"
@@ -70,39 +47,45 @@ def fetch_top_gainer_symbols(app, rows=SCANNER_ROWS):
     scan_sub.abovePrice = 1
     scan_sub.numberOfRows = rows
 
-    reqId = app.get_next_req_id()
-    app.reqScannerSubscription(reqId, scan_sub, [], [])
-
-    # Wait for scanner results
-    timeout = 10.0
-    waited = 0.0
-    interval = 0.2
-    while not done[0] and waited < timeout:
-        time.sleep(interval)
-        waited += interval
+    # Wait for scanner results (returns as soon as the snapshot is complete)
+    for contractDetails in app.fetch_scanner_results(scan_sub, timeout=10.0):
+        # contractDetails is a ContractDetails object, not an int
+        try:
+            symbol = contractDetails.contract.symbol
+            if symbol not in seen:
+                seen.add(symbol)
+                symbols.append(symbol)
+        except Exception:
+            pass
 
-    app.cancelScannerSubscription(reqId)
     return symbols
 
 def get_today_gainers(symbols, app):
     gainers = []
-    for symbol in symbols:
-        bars = app.fetch_historical_bars(
-            symbol=symbol,
-            end_date=datetime.now(),
-            duration="1 D",
-            bar_size="1 day",
-            what_to_show="TRADES"
+    # Daily bars are independent TWS round-trips, so fetch them concurrently
+    # (bounded to stay within IBKR's historical-data pacing)
+    end_date = datetime.now()
+    with ThreadPoolExecutor(max_workers=HISTORICAL_WORKERS) as ex:
+        fetched = ex.map(
+            lambda s: app.fetch_historical_bars(
+                symbol=s,
+                end_date=end_date,
+                duration="1 D",
+                bar_size="1 day",
+                what_to_show="TRADES"
+            ),
+            symbols
         )
-        if not bars or len(bars) < 1:
-            continue
-        bar = bars[-1]
-        open_price = bar['open']
-        close_price = bar['close']
-        if open_price > 0:
-            pct_change = ((close_price - open_price) / open_price) * 100
-            if pct_change >= PCT_GAIN_THRESHOLD:
-                gainers.append(symbol)
+        for symbol, bars in zip(symbols, fetched):
+            if not bars or len(bars) < 1:
+                continue
+            bar = bars[-1]
+            open_price = bar.open
+            close_price = bar.close
+            if open_price > 0:
+                pct_change = ((close_price - open_price) / open_price) * 100
+                if pct_change >= PCT_GAIN_THRESHOLD:
+                    gainers.append(symbol)
     return gainers
 
 
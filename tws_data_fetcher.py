@@ -7,13 +7,21 @@ from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
 from ibapi.common import TickerId, TickAttrib, BarData
 from ibapi.ticktype import TickTypeEnum
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import List, Dict, Callable, Optional
-from collections import deque
+from typing import List, Dict, Callable, NamedTuple, Optional
+from functools import lru_cache
+from operator import attrgetter
 import threading
 import time
 
 
+# Upper bound on concurrent fetch_historical_bars calls when fetching for many symbols
+# at once; IBKR paces historical-data queries, so bulk fetches share this limit
+HISTORICAL_WORKERS = 10
+
+
+@lru_cache(maxsize=None)
 def tick_type_str(tickType):
     """Return a human-friendly string for tickType across ibapi versions."""
     try:
@@ -31,6 +39,74 @@ def tick_type_str(tickType):
         return str(tickType)
 
 
+def _bar_vwap_getter(bar) -> Callable:
+    """Return a function reading a bar's VWAP; its attribute name varies by ibapi version"""
+    if hasattr(bar, 'average'):
+        return attrgetter('average')
+    if hasattr(bar, 'wap'):
+        return attrgetter('wap')
+    # Fallback: calculate simple average of high and low
+    return lambda bar: (bar.high + bar.low) / 2.0
+
+
+# Tick types the handlers act on, resolved to their integer codes once so each tick
+# is dispatched with int compares (tick_type_str is for logging)
+_TT_BID = TickTypeEnum.BID
+_TT_ASK = TickTypeEnum.ASK
+_TT_LAST = TickTypeEnum.LAST
+_TT_BID_SIZE = TickTypeEnum.BID_SIZE
+_TT_ASK_SIZE = TickTypeEnum.ASK_SIZE
+_TT_LAST_SIZE = TickTypeEnum.LAST_SIZE
+_TT_VOLUME = TickTypeEnum.VOLUME
+
+# error() codes: informational data farm connection messages are dropped, and these
+# connectivity warnings are shown alongside real errors (code >= 500)
+_SUPPRESSED_ERROR_CODES = frozenset({
+    2104, 2107, 2119,  # Market data farm connection messages
+    2106,  # HMDS data farm connection
+    2158,  # Sec-def data farm connection
+})
+_WARNING_ERROR_CODES = frozenset({1100, 1101, 1102, 1300})
+
+# Quote field each plain price/size tick overwrites; VOLUME is handled separately
+# since it also drives the VWAP and the callback
+_PRICE_FIELDS = {_TT_LAST: 'price', _TT_BID: 'bid', _TT_ASK: 'ask'}
+_SIZE_FIELDS = {_TT_LAST_SIZE: 'last_size', _TT_BID_SIZE: 'bid_size', _TT_ASK_SIZE: 'ask_size'}
+
+
+class HistoricalBar(NamedTuple):
+    """One bar as returned by fetch_historical_bars"""
+    date: str  # 'YYYYMMDD' or 'YYYYMMDD HH:MM:SS', optionally with a timezone
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    average: float  # VWAP
+    barCount: int
+
+
+@dataclass(slots=True)
+class RealtimeQuote:
+    """Latest market data for one subscribed symbol, as maintained by the tick handlers"""
+    price: float = 0.0
+    bid: float = 0.0
+    ask: float = 0.0
+    last_size: int = 0
+    bid_size: int = 0
+    ask_size: int = 0
+    volume: int = 0  # cumulative daily volume (reqMktData)
+    trade_volume: float = 0.0  # shares traded since subscribing (tick-by-tick)
+    vwap: float = 0.0
+    # Cumulative VWAP tracking
+    cumulative_pv: float = 0.0
+    cumulative_volume: float = 0.0
+    last_daily_volume: int = 0
+    # Guards the fields above; ticks for different symbols never contend with each
+    # other or with requests that take the app-wide TWSDataApp.lock
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+
 class TWSDataApp(EClient, EWrapper):
     """
     TWS Application for fetching historical and real-time market data.
@@ -45,13 +121,22 @@ class TWSDataApp(EClient, EWrapper):
         self.lock = threading.Lock()
         
         # Historical data storage
-        self.historical_data = {}  # reqId -> list of bars
-        self.historical_complete = {}  # reqId -> bool
+        self.historical_data = {}  # reqId -> list of HistoricalBar
+        self.historical_complete = {}  # reqId -> threading.Event, set by historicalDataEnd
+        self._bar_vwap = None  # bar -> VWAP, chosen by _bar_vwap_getter on the first bar
         
         # Real-time data storage
-        self.realtime_callbacks = {}  # reqId -> (symbol, callback)
-        self.realtime_data = {}  # symbol -> {price, bid, ask, last_size, bid_size, ask_size, volume, vwap}
-        self.contracts = {}  # symbol -> Contract
+        # reqId -> (symbol, callback). Read on every tick without a lock: subscribe and
+        # unsubscribe never mutate it, they swap in an updated copy under self.lock
+        self.realtime_callbacks = {}
+        self.realtime_req_ids: Dict[str, List[int]] = {}  # symbol -> its reqIds in realtime_callbacks
+        self.tick_by_tick_req_ids = set()  # reqIds from reqTickByTickData (cancelled differently)
+        self.realtime_data: Dict[str, RealtimeQuote] = {}  # symbol -> quote, created on subscribe
+        self.contracts = {}  # symbol -> Contract, built once by stock_contract and reused
+        
+        # Market scanner storage
+        self.scanner_data = {}  # reqId -> list of ContractDetails, in rank order
+        self.scanner_complete = {}  # reqId -> threading.Event, set by scannerDataEnd
         
     def nextValidId(self, orderId: int):
         """Called when connection is established"""
@@ -62,135 +147,167 @@ class TWSDataApp(EClient, EWrapper):
     def error(self, reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson="", *args):
         """Error handler - accepts variable arguments for compatibility across ibapi versions"""
         # Suppress common info/warning messages that don't affect functionality
-        suppressed_codes = [
-            2104, 2106, 2107, 2119, 2158,  # Market data farm connection messages
-            2106,  # HMDS data farm connection
-            2158,  # Sec-def data farm connection
-        ]
-        if errorCode in suppressed_codes:
+        if errorCode in _SUPPRESSED_ERROR_CODES:
             return
         if errorCode == 10167:  # Displaying delayed market data
             print(f"[TWS] Using delayed market data (live subscription may be needed)")
             return
         # Only show actual errors (code >= 500) or important warnings
-        if errorCode >= 500 or errorCode in [1100, 1101, 1102, 1300]:
+        if errorCode >= 500 or errorCode in _WARNING_ERROR_CODES:
             print(f"[TWS Error] ReqId: {reqId}, Code: {errorCode}, Msg: {errorString}")
         
     def historicalData(self, reqId: int, bar: BarData):
         """Receive historical bar data"""
         with self.lock:
-            if reqId not in self.historical_data:
-                self.historical_data[reqId] = []
+            bars = self.historical_data.get(reqId)
+            if bars is None:
+                return  # not (or no longer) awaited by fetch_historical_bars
             
-            # Get VWAP - attribute name varies by ibapi version
-            vwap = 0.0
-            if hasattr(bar, 'average'):
-                vwap = bar.average
-            elif hasattr(bar, 'wap'):
-                vwap = bar.wap
-            else:
-                # Fallback: calculate simple average of high and low
-                vwap = (bar.high + bar.low) / 2.0
+            # Get VWAP - attribute name varies by ibapi version, so it is probed on the
+            # first bar only
+            get_vwap = self._bar_vwap
+            if get_vwap is None:
+                get_vwap = self._bar_vwap = _bar_vwap_getter(bar)
+            vwap = get_vwap(bar)
             
-            self.historical_data[reqId].append({
-                'date': bar.date,
-                'open': bar.open,
-                'high': bar.high,
-                'low': bar.low,
-                'close': bar.close,
-                'volume': bar.volume,
-                'average': vwap,  # VWAP
-                'barCount': bar.barCount
-            })
+            bars.append(HistoricalBar(
+                bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume, vwap, bar.barCount
+            ))
     
     def historicalDataEnd(self, reqId: int, start: str, end: str):
         """Called when historical data is complete"""
         with self.lock:
-            self.historical_complete[reqId] = True
+            done = self.historical_complete.get(reqId)
+        if done is not None:
+            done.set()
         print(f"[TWS] Historical data complete for reqId {reqId} ({start} to {end})")
     
+    def scannerData(self, reqId: int, rank: int, contractDetails, distance: str,
+                    benchmark: str, projection: str, legsStr: str):
+        """Receive one market scanner result row"""
+        with self.lock:
+            if reqId in self.scanner_data:
+                self.scanner_data[reqId].append(contractDetails)
+    
+    def scannerDataEnd(self, reqId: int):
+        """Called when a market scanner snapshot is complete"""
+        with self.lock:
+            done = self.scanner_complete.get(reqId)
+        if done is not None:
+            done.set()
+    
     def tickPrice(self, reqId: TickerId, tickType: int, price: float, attrib: TickAttrib):
         """Handle price ticks"""
-        with self.lock:
-            if reqId not in self.realtime_callbacks:
-                return
-            symbol, callback = self.realtime_callbacks[reqId]
-            
-            if symbol not in self.realtime_data:
-                self.realtime_data[symbol] = {
-                    'price': 0.0, 'bid': 0.0, 'ask': 0.0,
-                    'last_size': 0, 'bid_size': 0, 'ask_size': 0,
-                    'volume': 0, 'vwap': 0.0
-                }
-            
-            tt = tick_type_str(tickType)
-            if tt == 'LAST':
-                self.realtime_data[symbol]['price'] = price
-            elif tt == 'BID':
-                self.realtime_data[symbol]['bid'] = price
-            elif tt == 'ASK':
-                self.realtime_data[symbol]['ask'] = price
+        field_name = _PRICE_FIELDS.get(tickType)
+        if field_name is None:
+            return  # high/low/close/open etc. are not tracked
+        entry = self.realtime_callbacks.get(reqId)
+        if entry is None:
+            return
+        
+        quote = self.realtime_data[entry[0]]
+        with quote.lock:
+            setattr(quote, field_name, price)
     
     def tickSize(self, reqId: TickerId, tickType: int, size: int):
         """Handle size ticks"""
-        with self.lock:
-            if reqId not in self.realtime_callbacks:
+        entry = self.realtime_callbacks.get(reqId)
+        if entry is None:
+            return
+        symbol, callback = entry
+        
+        quote = self.realtime_data[symbol]
+        if tickType != _TT_VOLUME:
+            field_name = _SIZE_FIELDS.get(tickType)
+            if field_name is not None:
+                with quote.lock:
+                    setattr(quote, field_name, size)
+            return
+        
+        with quote.lock:
+            quote.volume = size
+            
+            # Trigger callback when we have price and volume update
+            price = quote.price
+            if price <= 0:
                 return
-            symbol, callback = self.realtime_callbacks[reqId]
             
-            if symbol not in self.realtime_data:
-                self.realtime_data[symbol] = {
-                    'price': 0.0, 'bid': 0.0, 'ask': 0.0,
-                    'last_size': 0, 'bid_size': 0, 'ask_size': 0,
-                    'volume': 0, 'vwap': 0.0
-                }
+            # Calculate incremental volume
+            current_daily_volume = size
+            last_daily_volume = quote.last_daily_volume
+            volume_increment = current_daily_volume - last_daily_volume
+            
+            if volume_increment <= 0:
+                return  # IBKR repeated the daily volume: no new trades, nothing to report
+            
+            quote.cumulative_pv += price * volume_increment
+            quote.cumulative_volume += volume_increment
+            quote.last_daily_volume = current_daily_volume
+            
+            # Calculate accurate cumulative VWAP
+            vwap = quote.cumulative_pv / quote.cumulative_volume
+            quote.vwap = vwap
+            bid = quote.bid
+            ask = quote.ask
+        
+        # Call callback with updated data outside the lock, so a slow consumer
+        # does not hold up further ticks for this symbol
+        callback(symbol, price, current_daily_volume, vwap, time.time(), bid, ask)
+    
+    def tickByTickAllLast(self, reqId: int, tickType: int, trade_time: int, price: float, size,
+                          tickAttribLast, exchange: str, specialConditions: str):
+        """Handle one trade from a tick-by-tick subscription"""
+        size = float(size)  # Decimal in ibapi >= 10
+        if size <= 0:
+            return
+        entry = self.realtime_callbacks.get(reqId)
+        if entry is None:
+            return
+        symbol, callback = entry
         
-        tt = tick_type_str(tickType)
+        quote = self.realtime_data[symbol]
+        with quote.lock:
+            # Each call is exactly one trade, so it feeds the VWAP directly
+            quote.price = price
+            quote.last_size = size
+            quote.trade_volume += size
+            quote.cumulative_pv += price * size
+            quote.cumulative_volume += size
+            vwap = quote.vwap = quote.cumulative_pv / quote.cumulative_volume
+            bid = quote.bid
+            ask = quote.ask
         
-        if tt == 'LAST_SIZE':
-            with self.lock:
-                self.realtime_data[symbol]['last_size'] = size
-        elif tt == 'BID_SIZE':
-            with self.lock:
-                self.realtime_data[symbol]['bid_size'] = size
-        elif tt == 'ASK_SIZE':
-            with self.lock:
-                self.realtime_data[symbol]['ask_size'] = size
-        elif tt == 'VOLUME':
-            with self.lock:
-                old_volume = self.realtime_data[symbol]['volume']
-                self.realtime_data[symbol]['volume'] = size
-                
-                # Trigger callback when we have price and volume update
-                price = self.realtime_data[symbol]['price']
-                if price > 0:
-                    # Initialize cumulative tracking if not present
-                    if 'cumulative_pv' not in self.realtime_data[symbol]:
-                        self.realtime_data[symbol]['cumulative_pv'] = 0.0
-                        self.realtime_data[symbol]['cumulative_volume'] = 0.0
-                    
-                    # Calculate incremental volume
-                    current_daily_volume = size
-                    last_daily_volume = self.realtime_data[symbol].get('last_daily_volume', 0)
-                    volume_increment = current_daily_volume - last_daily_volume
-                    
-                    if volume_increment > 0:
-                        self.realtime_data[symbol]['cumulative_pv'] += price * volume_increment
-                        self.realtime_data[symbol]['cumulative_volume'] += volume_increment
-                        self.realtime_data[symbol]['last_daily_volume'] = current_daily_volume
-                    
-                    # Calculate accurate cumulative VWAP
-                    if self.realtime_data[symbol]['cumulative_volume'] > 0:
-                        vwap = self.realtime_data[symbol]['cumulative_pv'] / self.realtime_data[symbol]['cumulative_volume']
-                    else:
-                        vwap = price
-                    
-                    self.realtime_data[symbol]['vwap'] = vwap
-                    
-                    # Call callback with updated data
-                    bid = self.realtime_data[symbol].get('bid', 0.0)
-                    ask = self.realtime_data[symbol].get('ask', 0.0)
-                    callback(symbol, price, current_daily_volume, vwap, datetime.now(), bid, ask)
+        callback(symbol, price, size, vwap, trade_time, bid, ask)
+    
+    def tickByTickBidAsk(self, reqId: int, time: int, bidPrice: float, askPrice: float,
+                         bidSize, askSize, tickAttribBidAsk):
+        """Handle a quote update from a tick-by-tick subscription"""
+        entry = self.realtime_callbacks.get(reqId)
+        if entry is None:
+            return
+        
+        quote = self.realtime_data[entry[0]]
+        with quote.lock:
+            quote.bid = bidPrice
+            quote.ask = askPrice
+            quote.bid_size = bidSize
+            quote.ask_size = askSize
+    
+    def stock_contract(self, symbol: str) -> Contract:
+        """
+        Return the SMART-routed USD stock contract for symbol. Requests only read their
+        contract, so one instance per symbol is shared by every request for it (threads
+        racing on a new symbol at worst build it twice; both are equivalent).
+        """
+        contract = self.contracts.get(symbol)
+        if contract is None:
+            contract = Contract()
+            contract.symbol = symbol
+            contract.secType = "STK"
+            contract.exchange = "SMART"
+            contract.currency = "USD"
+            self.contracts[symbol] = contract
+        return contract
     
     def get_next_req_id(self):
         """Get next request ID"""
@@ -206,19 +323,16 @@ class TWSDataApp(EClient, EWrapper):
         duration: str = "1 D",
         bar_size: str = "10 secs",
         what_to_show: str = "TRADES"
-    ) -> List[Dict]:
+    ) -> List['HistoricalBar']:
         """Fetch historical bar data from TWS."""
-        contract = Contract()
-        contract.symbol = symbol
-        contract.secType = "STK"
-        contract.exchange = "SMART"
-        contract.currency = "USD"
+        contract = self.stock_contract(symbol)
         
         req_id = self.get_next_req_id()
+        done = threading.Event()
         
         with self.lock:
             self.historical_data[req_id] = []
-            self.historical_complete[req_id] = False
+            self.historical_complete[req_id] = done
         
         end_date_str = end_date.strftime("%Y%m%d %H:%M:%S") + " US/Eastern"
         
@@ -235,40 +349,108 @@ class TWSDataApp(EClient, EWrapper):
             chartOptions=[]
         )
         
-        timeout = 30.0
-        waited = 0.0
-        while waited < timeout:
-            with self.lock:
-                if self.historical_complete.get(req_id, False):
-                    return self.historical_data[req_id]
-            time.sleep(0.1)
-            waited += 0.1
-        return []
+        # Returns as soon as historicalDataEnd arrives; no bars after 30s
+        completed = done.wait(30.0)
+        with self.lock:
+            del self.historical_complete[req_id]
+            bars = self.historical_data.pop(req_id)
+        return bars if completed else []
+
+    def fetch_scanner_results(self, subscription, timeout: float = 10.0) -> List:
+        """
+        Run a market scanner subscription and return its result rows (ContractDetails,
+        in rank order). Returns whatever arrived if the snapshot does not complete
+        within `timeout` seconds.
+        """
+        req_id = self.get_next_req_id()
+        done = threading.Event()
+        with self.lock:
+            self.scanner_data[req_id] = []
+            self.scanner_complete[req_id] = done
+        
+        self.reqScannerSubscription(req_id, subscription, [], [])
+        done.wait(timeout)
+        self.cancelScannerSubscription(req_id)
+        
+        with self.lock:
+            del self.scanner_complete[req_id]
+            return self.scanner_data.pop(req_id)
 
     def subscribe_market_data(self, symbol: str, callback: Callable):
-        """Subscribe to real-time market data"""
-        contract = Contract()
-        contract.symbol = symbol
-        contract.secType = "STK"
-        contract.exchange = "SMART"
-        contract.currency = "USD"
+        """
+        Subscribe to real-time market data. The callback is called as
+        callback(symbol, price, volume, vwap, timestamp, bid, ask) with the cumulative
+        daily volume and timestamp in Unix epoch seconds (datetime.fromtimestamp()
+        converts it where a datetime is needed).
+        """
+        self.subscribe_market_data_many({symbol: callback})
+
+    def subscribe_market_data_many(self, subscriptions: Dict[str, Callable]):
+        """
+        Subscribe to real-time market data for several symbols (symbol -> callback, as
+        for subscribe_market_data). The callback table is copied once for the whole
+        batch rather than once per symbol.
+        """
+        requests = [(symbol, self.stock_contract(symbol)) for symbol in subscriptions]
         
-        req_id = self.get_next_req_id()
         with self.lock:
-            self.realtime_callbacks[req_id] = (symbol, callback)
-            self.contracts[symbol] = contract
-            
-        self.reqMktData(req_id, contract, "", False, False, [])
-        print(f"[TWS] Subscribed to {symbol} (reqId: {req_id})")
+            callbacks = dict(self.realtime_callbacks)
+            req_ids = range(self.req_id_counter, self.req_id_counter + len(requests))
+            self.req_id_counter += len(requests)
+            for req_id, (symbol, contract) in zip(req_ids, requests):
+                callbacks[req_id] = (symbol, subscriptions[symbol])
+                self.realtime_req_ids.setdefault(symbol, []).append(req_id)
+                # Kept across re-subscriptions, like the cumulative VWAP it holds
+                if symbol not in self.realtime_data:
+                    self.realtime_data[symbol] = RealtimeQuote()
+            self.realtime_callbacks = callbacks
+        
+        for req_id, (symbol, contract) in zip(req_ids, requests):
+            self.reqMktData(req_id, contract, "", False, False, [])
+            print(f"[TWS] Subscribed to {symbol} (reqId: {req_id})")
+
+    def subscribe_tick_by_tick(self, symbol: str, callback: Callable):
+        """
+        Subscribe to tick-by-tick data: every trade ('AllLast') and every quote change
+        ('BidAsk') instead of reqMktData's aggregated snapshots (~250 ms). The callback
+        fires once per trade with subscribe_market_data's arguments, except that volume
+        is that trade's size rather than a cumulative total. IBKR allows only a few
+        tick-by-tick subscriptions at once, depending on the account.
+        """
+        contract = self.stock_contract(symbol)
+        
+        trades_id = self.get_next_req_id()
+        quotes_id = self.get_next_req_id()
+        with self.lock:
+            callbacks = dict(self.realtime_callbacks)
+            callbacks[trades_id] = (symbol, callback)
+            callbacks[quotes_id] = (symbol, callback)
+            self.realtime_callbacks = callbacks
+            self.realtime_req_ids.setdefault(symbol, []).extend((trades_id, quotes_id))
+            self.tick_by_tick_req_ids.update((trades_id, quotes_id))
+            if symbol not in self.realtime_data:
+                self.realtime_data[symbol] = RealtimeQuote()
+        
+        self.reqTickByTickData(quotes_id, contract, "BidAsk", 0, False)
+        self.reqTickByTickData(trades_id, contract, "AllLast", 0, False)
+        print(f"[TWS] Subscribed to {symbol} tick-by-tick (reqIds: {trades_id}, {quotes_id})")
 
     def unsubscribe_market_data(self, symbol: str):
-        """Unsubscribe from real-time market data"""
+        """Unsubscribe from real-time market data (either kind of subscription)"""
         with self.lock:
-            for req_id, (s, _) in list(self.realtime_callbacks.items()):
-                if s == symbol:
+            req_ids = self.realtime_req_ids.pop(symbol, None)
+            if not req_ids:
+                return
+            callbacks = dict(self.realtime_callbacks)
+            for req_id in req_ids:
+                if req_id in self.tick_by_tick_req_ids:
+                    self.tick_by_tick_req_ids.discard(req_id)
+                    self.cancelTickByTickData(req_id)
+                else:
                     self.cancelMktData(req_id)
-                    del self.realtime_callbacks[req_id]
-                    print(f"[TWS] Unsubscribed from {symbol}")
+                del callbacks[req_id]
+            self.realtime_callbacks = callbacks
+        print(f"[TWS] Unsubscribed from {symbol}")
 
 
 def create_tws_data_app(host: str, port: int, client_id: int) -> TWSDataApp: